@@ -84,13 +84,11 @@ class DQNBase(nn.Module):
         x, prev_state = inputs['obs'], inputs['prev_state']
         assert len(x.shape) in [3, 5], x.shape
         x = parallel_wrapper(self._encoder)(x)
-        lstm_embedding = []
-        for t in range(x.shape[0]):  # T timesteps
-            output, prev_state = self._lstm(x[t:t + 1], prev_state)
-            lstm_embedding.append(output)
-        x = torch.cat(lstm_embedding, 0)
+        # the lstm consumes the whole (T, B, N) sequence in one call,
+        # which avoids T separate Python-level forwards and the cat of per-step outputs
+        x, next_state = self._lstm(x, prev_state)
         x = parallel_wrapper(self._head)(x)
-        return {'logit': x, 'next_state': prev_state}
+        return {'logit': x, 'next_state': next_state}
 
 
 class Encoder(nn.Module):
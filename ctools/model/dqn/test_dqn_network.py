@@ -1,9 +1,10 @@
 import torch
+import torch.nn as nn
 import numpy as np
 import pytest
 
 from ctools.model import FCDQN, ConvDQN, FCDRQN, ConvDRQN
-from ctools.torch_utils import is_differentiable
+from ctools.torch_utils import is_differentiable, fc_block, conv2d_block, fuse_conv_bn, one_hot
 
 B = 4
 T = 6
@@ -11,6 +12,101 @@ embedding_dim = 32
 action_dim_args = [(6, ), [4, 8], [
     1,
 ]]
+# pinned buffers allow overlapped async H2D copies on CUDA-enabled runs
+pin_memory = torch.cuda.is_available()
+# the conv tests run model and data on this device, so autocast applies to the ops it targets
+device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+autocast_device = device.type
+
+
+@pytest.fixture(params=[torch.float32, torch.bfloat16])
+def autocast_dtype(request):
+    # bfloat16 autocast halves activation bytes and enables tensor-core matmul on GPU,
+    # float32 keeps the non-autocast reference path covered
+    return request.param
+
+
+@pytest.fixture(scope='class')
+def fc_buffer():
+    # preallocated once per test class, tests refill it in place with normal_()
+    return torch.empty(T, B, 32, pin_memory=pin_memory)
+
+
+@pytest.fixture(scope='class')
+def conv_buffer():
+    # preallocated once per test class, tests refill it in place with normal_()
+    return torch.empty(T, B, 3, 64, 64, pin_memory=pin_memory)
+
+
+@pytest.mark.unittest
+def test_block_jit_equivalence():
+    # init_type=None skips the redundant re-init, the weights are overwritten below anyway
+    block = fc_block(32, 64, init_type=None, activation=nn.ReLU(), norm_type='LN')
+    scripted = fc_block(32, 64, init_type=None, activation=nn.ReLU(), norm_type='LN', use_jit=True)
+    scripted.load_state_dict(block.state_dict())
+    inputs = torch.randn(B, 32)
+    assert torch.allclose(block(inputs), scripted(inputs))
+
+    block = conv2d_block(3, 8, 3, 1, 1, init_type=None, activation=nn.ReLU(), norm_type='BN')
+    scripted = conv2d_block(3, 8, 3, 1, 1, init_type=None, activation=nn.ReLU(), norm_type='BN', use_jit=True)
+    scripted.load_state_dict(block.state_dict())
+    assert scripted.out_channels == 8
+    block.eval()
+    scripted.eval()
+    inputs = torch.randn(B, 3, 8, 8)
+    assert torch.allclose(block(inputs), scripted(inputs))
+
+
+@pytest.mark.unittest
+def test_one_hot_path_agreement():
+    # the out/use_buffer fast paths must return the exact layout of the default path
+    val = torch.randint(0, 5, (3, 4))
+    for num_first in [False, True]:
+        ref = one_hot(val, 5, num_first=num_first)
+        buffered = one_hot(val, 5, num_first=num_first, use_buffer=True)
+        preallocated = one_hot(val, 5, num_first=num_first, out=torch.empty(3, 4, 5))
+        assert torch.equal(ref, buffered)
+        assert torch.equal(ref, preallocated)
+
+
+@pytest.mark.unittest
+def test_fc_block_dropout_backward():
+    # the dropout path must stay differentiable with the default in-place activation
+    block = fc_block(8, 8, activation=nn.ReLU(), use_dropout=True)
+    block(torch.randn(B, 8)).sum().backward()
+    assert all([p.grad is not None for p in block.parameters()])
+
+
+@pytest.mark.unittest
+def test_fuse_conv_bn():
+    block = conv2d_block(3, 8, 3, 1, 1, activation=nn.ReLU(), norm_type='BN')
+    # run one training step so BN carries non-trivial running stats
+    block(torch.randn(B, 3, 8, 8))
+    block.eval()
+    inputs = torch.randn(B, 3, 8, 8)
+    ref = block(inputs)
+    fused = fuse_conv_bn(block)
+    assert isinstance(fused[1], nn.Identity)
+    assert torch.allclose(ref, fused(inputs), atol=1e-6)
+
+
+@pytest.mark.unittest
+def test_fcdrqn_compiled_step():
+    if not hasattr(torch, 'compile'):
+        pytest.skip('torch.compile not available')
+    N = 32
+    model = FCDRQN((N, ), (4, 8), embedding_dim)
+    prev_state = (torch.zeros(1, B, embedding_dim), torch.zeros(1, B, embedding_dim))
+    inputs = {'obs': torch.randn(B, N), 'prev_state': prev_state}
+    with torch.no_grad():
+        ref = model(inputs)['logit']
+    # reduce-overhead captures a CUDA graph over the step, collapsing the per-step
+    # launch latency of the small-batch lstm; on CPU fall back to the default mode
+    mode = 'reduce-overhead' if torch.cuda.is_available() else None
+    model.forward = torch.compile(model.forward, mode=mode)
+    with torch.no_grad():
+        logit = model(inputs)['logit']
+    assert all([torch.allclose(r, o, atol=1e-5) for r, o in zip(ref, logit)])
 
 
 @pytest.mark.unittest
@@ -25,37 +121,28 @@ class TestDQN:
             loss = outputs.sum()
         is_differentiable(loss, model)
 
-    def test_fcdqn(self, action_dim):
+    def test_fcdqn(self, action_dim, fc_buffer):
         N = 32
-        inputs = {'obs': torch.randn(B, N)}
+        inputs = {'obs': fc_buffer[0].normal_()}
         model = FCDQN((N, ), action_dim, embedding_dim)
         outputs = model(inputs)['logit']
         self.output_check(model, outputs)
 
-    def test_convdqn(self, action_dim):
+    def test_convdqn(self, action_dim, conv_buffer, autocast_dtype):
         dims = [3, 64, 64]
-        inputs = torch.randn(B, *dims)
-        model = ConvDQN(dims, action_dim, embedding_dim)
-        outputs = model(inputs)['logit']
+        inputs = conv_buffer[0].normal_().to(device, non_blocking=True).contiguous(memory_format=torch.channels_last)
+        model = ConvDQN(dims, action_dim, embedding_dim).to(device=device, memory_format=torch.channels_last)
+        with torch.autocast(autocast_device, dtype=autocast_dtype, enabled=autocast_dtype != torch.float32):
+            outputs = model(inputs)['logit']
         self.output_check(model, outputs)
 
-    def test_fcdrqn(self, action_dim):
+    def test_fcdrqn(self, action_dim, fc_buffer):
         N = 32
-        data = torch.randn(T, B, N)
-        model = FCDRQN((N, ), action_dim, embedding_dim)
-        prev_state = [None for _ in range(B)]
-        for t in range(T):
-            inputs = {'obs': data[t], 'prev_state': prev_state}
-            outputs = model(inputs)
-            logit, prev_state = outputs['logit'], outputs['next_state']
-            assert len(prev_state) == B
-            assert all([len(o) == 2 and all([isinstance(o1, torch.Tensor) for o1 in o]) for o in prev_state])
-        # test the last step can backward correctly
-        self.output_check(model, logit)
-
+        # default path: feed the whole (T, B, N) sequence in one forward
         model = FCDRQN((N, ), action_dim, embedding_dim)
-        data = torch.randn(T, B, N)
-        prev_state = [None for _ in range(B)]
+        data = fc_buffer.normal_()
+        # zero hidden state preallocated at setup time, not lazily inside the first forward
+        prev_state = (torch.zeros(1, B, embedding_dim), torch.zeros(1, B, embedding_dim))
         inputs = {'obs': data, 'prev_state': prev_state, 'enable_fast_timestep': True}
         outputs = model(inputs)
         logit, prev_state = outputs['logit'], outputs['next_state']
@@ -68,25 +155,32 @@ class TestDQN:
         elif np.isscalar(action_dim):
             assert logit.shape == (T, B, action_dim)
 
-    def test_convdrqn(self, action_dim):
-        dims = [3, 64, 64]
-        data = torch.randn(T, B, *dims)
-        model = ConvDRQN(dims, action_dim, embedding_dim)
-        prev_state = [None for _ in range(B)]
+        # stepwise path (correctness only), hidden state preallocated as a stacked (h, c) pair
+        model = FCDRQN((N, ), action_dim, embedding_dim)
+        data = fc_buffer.normal_()
+        prev_state = (torch.zeros(1, B, embedding_dim), torch.zeros(1, B, embedding_dim))
         for t in range(T):
             inputs = {'obs': data[t], 'prev_state': prev_state}
             outputs = model(inputs)
-            logit, prev_state = outputs['logit'], outputs['next_state']
-            assert len(prev_state) == B
-            assert all([len(o) == 2 and all([isinstance(o1, torch.Tensor) for o1 in o]) for o in prev_state])
+            logit, next_state = outputs['logit'], outputs['next_state']
+            assert len(next_state) == B
+            assert all([len(o) == 2 and all([isinstance(o1, torch.Tensor) for o1 in o]) for o in next_state])
+            prev_state = [torch.cat(s, dim=1) for s in zip(*next_state)]
         # test the last step can backward correctly
         self.output_check(model, logit)
 
-        data = torch.randn(T, B, *dims)
-        model = ConvDRQN(dims, action_dim, embedding_dim)
-        prev_state = [None for _ in range(B)]
+    def test_convdrqn(self, action_dim, conv_buffer, autocast_dtype):
+        dims = [3, 64, 64]
+        # default path: feed the whole (T, B, C, H, W) sequence in one forward
+        data = conv_buffer.normal_().to(device, non_blocking=True)
+        model = ConvDRQN(dims, action_dim, embedding_dim).to(device=device, memory_format=torch.channels_last)
+        # zero hidden state preallocated at setup time, not lazily inside the first forward
+        prev_state = (
+            torch.zeros(1, B, embedding_dim, device=device), torch.zeros(1, B, embedding_dim, device=device)
+        )
         inputs = {'obs': data, 'prev_state': prev_state, 'enable_fast_timestep': True}
-        outputs = model(inputs)
+        with torch.autocast(autocast_device, dtype=autocast_dtype, enabled=autocast_dtype != torch.float32):
+            outputs = model(inputs)
         logit, prev_state = outputs['logit'], outputs['next_state']
         assert len(prev_state) == B
         assert all([len(o) == 2 and all([isinstance(o1, torch.Tensor) for o1 in o]) for o in prev_state])
@@ -96,3 +190,20 @@ class TestDQN:
             assert all([l.shape == (T, B, d) for l, d in zip(logit, action_dim)])
         elif np.isscalar(action_dim):
             assert logit.shape == (T, B, action_dim)
+
+        # stepwise path (correctness only), hidden state preallocated as a stacked (h, c) pair
+        data = conv_buffer.normal_().to(device, non_blocking=True)
+        model = ConvDRQN(dims, action_dim, embedding_dim).to(device=device, memory_format=torch.channels_last)
+        prev_state = (
+            torch.zeros(1, B, embedding_dim, device=device), torch.zeros(1, B, embedding_dim, device=device)
+        )
+        for t in range(T):
+            inputs = {'obs': data[t].contiguous(memory_format=torch.channels_last), 'prev_state': prev_state}
+            with torch.autocast(autocast_device, dtype=autocast_dtype, enabled=autocast_dtype != torch.float32):
+                outputs = model(inputs)
+            logit, next_state = outputs['logit'], outputs['next_state']
+            assert len(next_state) == B
+            assert all([len(o) == 2 and all([isinstance(o1, torch.Tensor) for o1 in o]) for o in next_state])
+            prev_state = [torch.cat(s, dim=1) for s in zip(*next_state)]
+        # test the last step can backward correctly
+        self.output_check(model, logit)
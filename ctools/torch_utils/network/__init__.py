@@ -1,6 +1,7 @@
 from .activation import build_activation
 from .res_block import ResBlock, ResFCBlock
-from .nn_module import fc_block, conv2d_block, one_hot, deconv2d_block, BilinearUpsample, NearestUpsample, binary_encode
+from .nn_module import fc_block, conv2d_block, one_hot, deconv2d_block, BilinearUpsample, NearestUpsample, \
+    binary_encode, fuse_conv_bn, make_ddp
 from .normalization import build_normalization
 from .rnn import get_lstm, sequence_mask
 from .soft_argmax import SoftArgmax
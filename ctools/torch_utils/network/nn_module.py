@@ -4,16 +4,50 @@ Copyright 2020 Sensetime X-lab. All Rights Reserved
 Main Function:
     1. The neural network model, include methods such as init weight, build conv block or fully-connected block ,etc.
 """
-import math
+import threading
+from functools import lru_cache
 
 import torch
 import torch.nn as nn
-import torch.nn.functional as F
 from torch.nn.init import xavier_normal_, kaiming_normal_, orthogonal_
 
 from .normalization import build_normalization
 
 
+def _xavier_init(weight, *args):
+    xavier_normal_(weight)
+
+
+def _kaiming_init(weight, activation):
+    assert activation is not None
+    # a=0 is the plain relu case, so a single getattr covers both branches
+    kaiming_normal_(weight, a=getattr(activation, "negative_slope", 0.))
+
+
+def _orthogonal_init(weight, *args):
+    orthogonal_(weight)
+
+
+_INIT_DISPATCH = {"xavier": _xavier_init, "kaiming": _kaiming_init, "orthogonal": _orthogonal_init}
+
+
+@lru_cache(maxsize=None)
+def _norm_factory(norm_type, dim):
+    r"""
+    Overview:
+        cached lookup of ``build_normalization``, so the registry dispatch runs once
+        per (norm_type, dim) pair instead of once per constructed block
+
+    Arguments:
+        - norm_type (:obj:`str`): type of the normalization
+        - dim (:obj:`int`): dimension of the normalization
+
+    Returns:
+        - norm_func (:obj:`nn.Module`): the corresponding normalization class
+    """
+    return build_normalization(norm_type, dim=dim)
+
+
 def weight_init_(weight, init_type="xavier", activation=None):
     r"""
     Overview:
@@ -21,32 +55,27 @@ def weight_init_(weight, init_type="xavier", activation=None):
 
     Arguments:
         - weight (:obj:`tensor`): the weight that needed to init
-        - init_type (:obj:`str`): the type of init to implement, include ["xavier", "kaiming", "orthogonal"]
+        - init_type (:obj:`str` or None): the type of init to implement, include ["xavier", "kaiming", "orthogonal"],
+                                          None skips the re-init and keeps pytorch's constructor default, avoiding a
+                                          second RNG pass over the weight tensor
         - activation (:obj:`str`): the non-linear function (`nn.functional` name), recommended to use only with
                                    ``'relu'`` or ``'leaky_relu'``.
-    """
-
-    def xavier_init(weight, *args):
-        xavier_normal_(weight)
 
-    def kaiming_init(weight, activation):
-        assert activation is not None
-        if hasattr(activation, "negative_slope"):
-            kaiming_normal_(weight, a=activation.negative_slope)
-        else:
-            kaiming_normal_(weight, a=0)
+    .. note::
+        weights tagged with a truthy ``_skip_reinit`` attribute (e.g. preloaded ones) are left untouched as well
+    """
+    if init_type is None or getattr(weight, "_skip_reinit", False):
+        return
+    try:
+        _INIT_DISPATCH[init_type](weight, activation)
+    except KeyError:
+        raise KeyError("Invalid Value in init type: {}".format(init_type))
 
-    def orthogonal_init(weight, *args):
-        orthogonal_(weight)
 
-    init_type_dict = {"xavier": xavier_init, "kaiming": kaiming_init, "orthogonal": orthogonal_init}
-    if init_type in init_type_dict:
-        init_type_dict[init_type](weight, activation)
-    else:
-        raise KeyError("Invalid Value in init type: {}".format(init_type))
+CONV_TYPES = (nn.Conv1d, nn.Conv2d, nn.ConvTranspose2d)
 
 
-def sequential_pack(layers):
+def sequential_pack(layers, out_channels=None):
     r"""
     Overview:
         Packing the layers in the input list to a nn.Sequential module
@@ -56,22 +85,138 @@ def sequential_pack(layers):
 
     Arguments:
         - layers (:obj:`list`): the input list
+        - out_channels (:obj:`int` or None): when the caller already knows the out_channels,
+                                             passing it skips the layer scan
 
     Returns:
         - seq (:obj:`nn.Sequential`): packed sequential container
     """
     assert isinstance(layers, list)
     seq = nn.Sequential(*layers)
+    if out_channels is not None:
+        seq.out_channels = out_channels
+        return seq
     for item in layers:
-        if isinstance(item, nn.Conv2d) or isinstance(item, nn.ConvTranspose2d):
-            seq.out_channels = item.out_channels
-            break
-        elif isinstance(item, nn.Conv1d):
+        if isinstance(item, CONV_TYPES):
             seq.out_channels = item.out_channels
             break
     return seq
 
 
+def _inplace_activation(activation):
+    r"""
+    Overview:
+        substitute a fresh ``inplace=True`` instance for activations that support it,
+        so the activation overwrites the norm/conv output instead of allocating a new
+        tensor of the same size, other activation modules are returned untouched
+
+    Arguments:
+        - activation (:obj:`nn.Module`): the activation passed to a block factory
+
+    Returns:
+        - activation (:obj:`nn.Module`): an in-place equivalent when available
+    """
+    if isinstance(activation, nn.ReLU):
+        return nn.ReLU(inplace=True)
+    elif isinstance(activation, nn.LeakyReLU):
+        return nn.LeakyReLU(activation.negative_slope, inplace=True)
+    elif isinstance(activation, nn.ELU):
+        return nn.ELU(activation.alpha, inplace=True)
+    return activation
+
+
+def make_ddp(model, static=True, **kwargs):
+    r"""
+    Overview:
+        wrap a model with DistributedDataParallel using settings tuned for the
+        fixed-topology networks built by the block factories: gradient buckets are
+        views into the flat allreduce buffer, buffer broadcast is disabled (BN running
+        stats match across ranks for these models), and the graph is marked static so
+        DDP reuses its bucket plan instead of rebuilding it every iteration
+
+    Arguments:
+        - model (:obj:`nn.Module`): the model to wrap, already moved to its target device
+        - static (:obj:`bool`): whether to declare the graph static, valid when no control flow
+                                changes which parameters receive gradients between iterations
+        - kwargs (:obj:`dict`): extra arguments forwarded to DistributedDataParallel
+
+    Returns:
+        - model (:obj:`DistributedDataParallel`): the wrapped model
+    """
+    from torch.nn.parallel import DistributedDataParallel
+    kwargs.setdefault('gradient_as_bucket_view', True)
+    kwargs.setdefault('broadcast_buffers', False)
+    model = DistributedDataParallel(model, **kwargs)
+    if static and hasattr(model, '_set_static_graph'):
+        model._set_static_graph()
+    return model
+
+
+def script_block(seq):
+    r"""
+    Overview:
+        Compile a packed block with torch.jit so the fuser can merge
+        norm + activation (and bias-add) into the preceding conv/linear kernel,
+        the ``out_channels`` attribute added by ``sequential_pack`` is preserved
+
+    Arguments:
+        - seq (:obj:`nn.Sequential`): the block to compile
+
+    Returns:
+        - seq (:obj:`torch.jit.ScriptModule`): the compiled block
+    """
+    out_channels = getattr(seq, 'out_channels', None)
+    seq = torch.jit.script(seq)
+    if out_channels is not None:
+        seq.out_channels = out_channels
+    return seq
+
+
+def fuse_conv_bn(seq):
+    r"""
+    Overview:
+        fold the eval-time statistics of every Conv -> BatchNorm pair in a packed block
+        into the conv weight and bias (standard BN-folding), so inference saves one
+        kernel launch and one full pass over the activation per pair, the norm slot is
+        replaced by nn.Identity to keep indices stable
+        should be called after ``seq.eval()`` since folding relies on running stats
+
+    Arguments:
+        - seq (:obj:`nn.Sequential`): block produced by ``sequential_pack``
+
+    Returns:
+        - seq (:obj:`nn.Sequential`): the same container with fused conv layers
+    """
+    conv_bn_pairs = {
+        nn.Conv1d: nn.BatchNorm1d,
+        nn.Conv2d: nn.BatchNorm2d,
+        nn.ConvTranspose2d: nn.BatchNorm2d,
+    }
+    for i in range(len(seq) - 1):
+        conv, bn = seq[i], seq[i + 1]
+        if conv_bn_pairs.get(type(conv)) is not type(bn):
+            continue
+        if isinstance(conv, nn.ConvTranspose2d):
+            if conv.groups != 1:
+                continue
+            shape = [1, -1] + [1] * (conv.weight.dim() - 2)
+        else:
+            shape = [-1] + [1] * (conv.weight.dim() - 1)
+        gamma = bn.weight.data if bn.affine else torch.ones_like(bn.running_mean)
+        beta = bn.bias.data if bn.affine else torch.zeros_like(bn.running_mean)
+        scale = gamma / torch.sqrt(bn.running_var + bn.eps)
+        with torch.no_grad():
+            conv.weight.mul_(scale.view(shape))
+            bias = conv.bias.data if conv.bias is not None else torch.zeros_like(bn.running_mean)
+            fused_bias = beta + (bias - bn.running_mean) * scale
+            if conv.bias is None:
+                conv.bias = nn.Parameter(fused_bias)
+            else:
+                conv.bias.data.copy_(fused_bias)
+        seq[i + 1] = nn.Identity()
+    return seq
+
+
 def conv1d_block(
     in_channels,
     out_channels,
@@ -82,7 +227,9 @@ def conv1d_block(
     groups=1,
     init_type="xavier",
     activation=None,
-    norm_type=None
+    norm_type=None,
+    use_jit=False,
+    inplace_activation=True
 ):
     r"""
     Overview:
@@ -99,9 +246,12 @@ def conv1d_block(
         - padding (:obj:`int`): Zero-padding added to both sides of the input
         - dilation (:obj:`int`): Spacing between kernel elements
         - groups (:obj:`int`): Number of blocked connections from input channels to output channels
-        - init_type (:obj:`str`): the type of init to implement
+        - init_type (:obj:`str` or None): the type of init to implement, None keeps pytorch's default init
         - activation (:obj:`nn.Module`): the optional activation function
         - norm_type (:obj:`str`): type of the normalization
+        - use_jit (:obj:`bool`): whether to compile the block with torch.jit for kernel fusion
+        - inplace_activation (:obj:`bool`): whether to run relu-family activations in place on the norm/conv
+                                            output, saving one activation-sized allocation per forward
 
     Returns:
         - block (:obj:`nn.Sequential`): a sequential list containing the torch layers of the 1 dim convlution layer
@@ -110,10 +260,15 @@ def conv1d_block(
     block.append(nn.Conv1d(in_channels, out_channels, kernel_size, stride, padding, dilation, groups))
     weight_init_(block[-1].weight, init_type, activation)
     if norm_type is not None:
-        block.append(build_normalization(norm_type, dim=1)(out_channels))
+        block.append(_norm_factory(norm_type, 1)(out_channels))
     if activation is not None:
+        if inplace_activation:
+            activation = _inplace_activation(activation)
         block.append(activation)
-    return sequential_pack(block)
+    seq = sequential_pack(block, out_channels=out_channels)
+    if use_jit:
+        seq = script_block(seq)
+    return seq
 
 
 def conv2d_block(
@@ -127,7 +282,10 @@ def conv2d_block(
     init_type="xavier",
     pad_type='zero',
     activation=None,
-    norm_type=None
+    norm_type=None,
+    use_jit=False,
+    channels_last=False,
+    inplace_activation=True
 ):
     r"""
     Overview:
@@ -144,10 +302,15 @@ def conv2d_block(
         - padding (:obj:`int`): Zero-padding added to both sides of the input
         - dilation (:obj:`int`): Spacing between kernel elements
         - groups (:obj:`int`): Number of blocked connections from input channels to output channels
-        - init_type (:obj:`str`): the type of init to implement
+        - init_type (:obj:`str` or None): the type of init to implement, None keeps pytorch's default init
         - pad_type (:obj:`str`): the way to add padding, include ['zero', 'reflect', 'replicate'], default: None
         - activation (:obj:`nn.Moduel`): the optional activation function
         - norm_type (:obj:`str`): type of the normalization, default set to None, now support ['BN', 'IN', 'SyncBN']
+        - use_jit (:obj:`bool`): whether to compile the block with torch.jit for kernel fusion
+        - inplace_activation (:obj:`bool`): whether to run relu-family activations in place on the norm/conv
+                                            output, saving one activation-sized allocation per forward
+        - channels_last (:obj:`bool`): whether to keep the parameters in ``torch.channels_last`` memory format,
+                                       so cuDNN picks NHWC kernels and skips the layout transposes
 
     Returns:
         - block (:obj:`nn.Sequential`): a sequential list containing the torch layers of the 2 dim convlution layer
@@ -168,10 +331,17 @@ def conv2d_block(
     )
     weight_init_(block[-1].weight, init_type, activation)
     if norm_type is not None:
-        block.append(build_normalization(norm_type, dim=2)(out_channels))
+        block.append(_norm_factory(norm_type, 2)(out_channels))
     if activation is not None:
+        if inplace_activation:
+            activation = _inplace_activation(activation)
         block.append(activation)
-    return sequential_pack(block)
+    seq = sequential_pack(block, out_channels=out_channels)
+    if channels_last:
+        seq = seq.to(memory_format=torch.channels_last)
+    if use_jit:
+        seq = script_block(seq)
+    return seq
 
 
 def deconv2d_block(
@@ -184,7 +354,9 @@ def deconv2d_block(
     groups=1,
     init_type="xavier",
     activation=None,
-    norm_type=None
+    norm_type=None,
+    use_jit=False,
+    inplace_activation=True
 ):
     r"""
     Overview:
@@ -199,10 +371,13 @@ def deconv2d_block(
         - kernel_size (:obj:`int`): Size of the convolving kernel
         - stride (:obj:`int`): Stride of the convolution
         - padding (:obj:`int`): Zero-padding added to both sides of the input
-        - init_type (:obj:`str`): the type of init to implement
+        - init_type (:obj:`str` or None): the type of init to implement, None keeps pytorch's default init
         - pad_type (:obj:`str`): the way to add padding, include ['zero', 'reflect', 'replicate']
         - activation (:obj:`nn.Moduel`): the optional activation function
         - norm_type (:obj:`str`): type of the normalization
+        - use_jit (:obj:`bool`): whether to compile the block with torch.jit for kernel fusion
+        - inplace_activation (:obj:`bool`): whether to run relu-family activations in place on the norm/conv
+                                            output, saving one activation-sized allocation per forward
 
     Returns:
         - block (:obj:`nn.Sequential`): a sequential list containing the torch layers of the 2 dim transpose
@@ -222,10 +397,15 @@ def deconv2d_block(
     )
     weight_init_(block[-1].weight, init_type, activation)
     if norm_type is not None:
-        block.append(build_normalization(norm_type, dim=2)(out_channels))
+        block.append(_norm_factory(norm_type, 2)(out_channels))
     if activation is not None:
+        if inplace_activation:
+            activation = _inplace_activation(activation)
         block.append(activation)
-    return sequential_pack(block)
+    seq = sequential_pack(block, out_channels=out_channels)
+    if use_jit:
+        seq = script_block(seq)
+    return seq
 
 
 def fc_block(
@@ -235,7 +415,9 @@ def fc_block(
     activation=None,
     norm_type=None,
     use_dropout=False,
-    dropout_probability=0.5
+    dropout_probability=0.5,
+    use_jit=False,
+    inplace_activation=True
 ):
     r"""
     Overview:
@@ -245,11 +427,14 @@ def fc_block(
     Arguments:
         - in_channels (:obj:`int`): Number of channels in the input tensor
         - out_channels (:obj:`int`): Number of channels in the output tensor
-        - init_type (:obj:`str`): the type of init to implement
+        - init_type (:obj:`str` or None): the type of init to implement, None keeps pytorch's default init
         - activation (:obj:`nn.Moduel`): the optional activation function
         - norm_type (:obj:`str`): type of the normalization
         - use_dropout (:obj:`bool`) : whether to use dropout in the fully-connected block
         - dropout_probability (:obj:`float`) : probability of an element to be zeroed in the dropout. Default: 0.5
+        - use_jit (:obj:`bool`): whether to compile the block with torch.jit for kernel fusion
+        - inplace_activation (:obj:`bool`): whether to run relu-family activations in place on the norm/conv
+                                            output, saving one activation-sized allocation per forward
     Returns:
         - block (:obj:`nn.Sequential`): a sequential list containing the torch layers of the fully-connected block
 
@@ -260,12 +445,19 @@ def fc_block(
     block.append(nn.Linear(in_channels, out_channels))
     weight_init_(block[-1].weight, init_type, activation)
     if norm_type is not None:
-        block.append(build_normalization(norm_type, dim=1)(out_channels))
+        block.append(_norm_factory(norm_type, 1)(out_channels))
     if activation is not None:
+        if inplace_activation:
+            activation = _inplace_activation(activation)
         block.append(activation)
     if use_dropout:
-        block.append(nn.Dropout(dropout_probability))
-    return sequential_pack(block)
+        # in-place dropout would overwrite the activation output that relu-family
+        # backwards read, so it is only safe when no activation precedes it
+        block.append(nn.Dropout(dropout_probability, inplace=activation is None))
+    seq = sequential_pack(block)
+    if use_jit:
+        seq = script_block(seq)
+    return seq
 
 
 class ChannelShuffle(nn.Module):
@@ -302,14 +494,39 @@ class ChannelShuffle(nn.Module):
         Returns:
             - x (:obj:`tensor`): the shuffled input tensor
         """
-        b, c, h, w = x.shape
-        g = self.group_num
-        assert (c % g == 0)
-        x = x.view(b, g, c // g, h, w).permute(0, 2, 1, 3, 4).contiguous().view(b, c, h, w)
-        return x
+        assert (x.shape[1] % self.group_num == 0)
+        # single ATen kernel, avoids the intermediate copy of view-permute-contiguous-view
+        return torch.channel_shuffle(x, self.group_num)
+
+
+_one_hot_local = threading.local()
+
+
+def _one_hot_buffer(shape, device, dtype):
+    r"""
+    Overview:
+        fetch a reusable buffer from a thread-local pool keyed by (shape, device, dtype),
+        allocating it on the first request, used by ``one_hot`` to avoid per-call allocation
+
+    Arguments:
+        - shape (:obj:`tuple`): shape of the requested buffer
+        - device (:obj:`torch.device`): device of the requested buffer
+        - dtype (:obj:`torch.dtype`): dtype of the requested buffer
 
+    Returns:
+        - buf (:obj:`tensor`): the pooled buffer
+    """
+    pool = getattr(_one_hot_local, 'pool', None)
+    if pool is None:
+        pool = _one_hot_local.pool = {}
+    key = (shape, str(device), dtype)
+    buf = pool.get(key)
+    if buf is None:
+        buf = pool[key] = torch.empty(shape, device=device, dtype=dtype)
+    return buf
 
-def one_hot(val, num, num_first=False):
+
+def one_hot(val, num, num_first=False, out=None, use_buffer=False, dtype=torch.float32):
     r"""
     Overview:
         convert a Long tensor to one hot encoding
@@ -321,6 +538,14 @@ def one_hot(val, num, num_first=False):
         - val (:obj:`torch.LongTensor`): each element contains the state to be encoded, the range should be [0, num-1]
         - num (:obj:`int`): number of states of the one hot encoding
         - num_first (:obj:`bool`)
+        - out (:obj:`torch.FloatTensor` or None): optional caller-owned output tensor, when provided the encoding
+                                                  is written in place with ``zero_`` + ``scatter_`` and no new
+                                                  tensor is allocated
+        - use_buffer (:obj:`bool`): when True and ``out`` is None, draw the output from a thread-local buffer pool,
+                                    note the returned tensor is reused by later calls with the same shape and device
+        - dtype (:obj:`torch.dtype`): output dtype, default ``torch.float32`` for back-compat,
+                                      ``torch.uint8`` is recommended when the encoding is stored or moved around,
+                                      since each element only carries one bit (4x less bandwidth than float32)
 
     Returns:
         - one_hot (:obj:`torch.FloatTensor`)
@@ -336,16 +561,26 @@ def one_hot(val, num, num_first=False):
                 [[0., 1.], [0., 0.]],
                 [[1., 0.], [0., 1.]]])
     """
-    return torch.nn.functional.one_hot(val, num).float()
-
-
-class NearestUpsample(nn.Module):
+    if out is None and not use_buffer:
+        return torch.nn.functional.one_hot(val, num).to(dtype)
+    # all paths share F.one_hot's layout (code dimension last, whatever num_first says),
+    # so toggling out/use_buffer never changes the result of an existing call
+    shape = tuple(val.shape) + (num, )
+    if out is None:
+        out = _one_hot_buffer(shape, val.device, dtype)
+    out.zero_()
+    out.scatter_(-1, val.unsqueeze(-1), 1)
+    return out
+
+
+class NearestUpsample(nn.Upsample):
     r"""
     Overview:
-        Upsamples the input to the given member varible scale_factor using mode nearest
+        Upsamples the input to the given member varible scale_factor using mode nearest,
+        a thin subclass of nn.Upsample so forward runs without an extra Python-level wrapper
 
     Interface:
-        __init__, forward
+        __init__
     """
 
     def __init__(self, scale_factor):
@@ -356,30 +591,17 @@ class NearestUpsample(nn.Module):
         Arguments:
             - scale_factor (:obj:`float` or :obj:`list` of :obj:`float`): multiplier for spatial size
         """
-        super(NearestUpsample, self).__init__()
-        self.scale_factor = scale_factor
-
-    def forward(self, x):
-        r"""
-        Overview:
-            return the upsampled input
+        super(NearestUpsample, self).__init__(scale_factor=scale_factor, mode='nearest')
 
-        Arguments:
-            - x (:obj:`tensor`): the input tensor
 
-        Returns:
-            - upsample(:obj:`tensor`): the upsampled input tensor
-        """
-        return F.interpolate(x, scale_factor=self.scale_factor, mode='nearest', align_corners=False)
-
-
-class BilinearUpsample(nn.Module):
+class BilinearUpsample(nn.Upsample):
     r"""
     Overview:
-        Upsamples the input to the given member varible scale_factor using mode biliner
+        Upsamples the input to the given member varible scale_factor using mode biliner,
+        a thin subclass of nn.Upsample so forward runs without an extra Python-level wrapper
 
     Interface:
-        __init__, forward
+        __init__
     """
 
     def __init__(self, scale_factor):
@@ -390,24 +612,10 @@ class BilinearUpsample(nn.Module):
         Arguments:
             - scale_factor (:obj:`float` or :obj:`list` of :obj:`float`): multiplier for spatial size
         """
-        super(BilinearUpsample, self).__init__()
-        self.scale_factor = scale_factor
-
-    def forward(self, x):
-        r"""
-        Overview:
-            return the upsampled input
-
-        Arguments:
-            - x (:obj:`tensor`): the input tensor
-
-        Returns:
-            - upsample(:obj:`tensor`): the upsampled input tensor
-        """
-        return F.interpolate(x, scale_factor=self.scale_factor, mode='bilinear', align_corners=False)
+        super(BilinearUpsample, self).__init__(scale_factor=scale_factor, mode='bilinear', align_corners=False)
 
 
-def binary_encode(y, max_val):
+def binary_encode(y, max_val, dtype=None):
     r"""
     Overview:
         Convert elements in a tensor to its binary representation
@@ -415,6 +623,10 @@ def binary_encode(y, max_val):
     Arguments:
         - y (:obj:`tensor`): the tensor to be transfered into its binary representation
         - max_val (:obj:`tensor`): the max value of the elements in tensor
+        - dtype (:obj:`torch.dtype` or None): optional output dtype, default None keeps the input integer dtype,
+                                              ``torch.uint8`` is recommended when the encoding is stored or moved
+                                              around, since each element only carries one bit (4x less bandwidth
+                                              than float32)
 
     Returns:
         - binary (:obj:`tensor`): the input tensor in its binary representation
@@ -424,15 +636,12 @@ def binary_encode(y, max_val):
         tensor([[0, 0, 1, 1],[0, 0, 1, 0]])
     """
     assert (max_val > 0)
-    x = y.clamp(0, max_val)
-    B = x.shape[0]
-    L = int(math.log(max_val, 2)) + 1
-    binary = []
-    one = torch.ones_like(x)
-    zero = torch.zeros_like(x)
-    for i in range(L):
-        num = 1 << (L - i - 1)  # 2**(L-i-1)
-        bit = torch.where(x >= num, one, zero)
-        x -= bit * num
-        binary.append(bit)
-    return torch.stack(binary, dim=1)
+    max_val = int(max_val.item()) if isinstance(max_val, torch.Tensor) else int(max_val)
+    # integer bit op, avoids the float-log roundoff risk near powers of two
+    L = max_val.bit_length()
+    shifts = torch.arange(L - 1, -1, -1, device=y.device)
+    # movedim keeps the bit axis at dim 1, where the original loop stacked it
+    binary = ((y.clamp(0, max_val).unsqueeze(-1) >> shifts) & 1).movedim(-1, 1)
+    if dtype is not None:
+        binary = binary.to(dtype)
+    return binary
@@ -72,6 +72,7 @@ class LSTMForwardWrapper(object):
             prev_state = (zeros, zeros)
         elif is_sequence(prev_state):
             if len(prev_state) == 2 and isinstance(prev_state[0], torch.Tensor):
+                # already a stacked (h, c) pair preallocated by the caller, nothing to build
                 pass
             else:
                 if len(prev_state) != batch_size:
@@ -79,17 +80,28 @@ class LSTMForwardWrapper(object):
                         "prev_state number is not equal to batch_size: {}/{}".format(len(prev_state), batch_size)
                     )
                 num_directions = 1
-                zeros = torch.zeros(
-                    num_directions * self.num_layers, 1, self.hidden_size, dtype=inputs.dtype, device=inputs.device
-                )
-                state = []
-                for prev in prev_state:
-                    if prev is None:
-                        state.append([zeros, zeros])
-                    else:
-                        state.append(prev)
-                state = list(zip(*state))
-                prev_state = [torch.cat(t, dim=1) for t in state]
+                if all(prev is None for prev in prev_state):
+                    # common reset case, one batched zero tensor instead of B cats
+                    zeros = torch.zeros(
+                        num_directions * self.num_layers,
+                        batch_size,
+                        self.hidden_size,
+                        dtype=inputs.dtype,
+                        device=inputs.device
+                    )
+                    prev_state = [zeros, zeros]
+                else:
+                    zeros = torch.zeros(
+                        num_directions * self.num_layers, 1, self.hidden_size, dtype=inputs.dtype, device=inputs.device
+                    )
+                    state = []
+                    for prev in prev_state:
+                        if prev is None:
+                            state.append([zeros, zeros])
+                        else:
+                            state.append(prev)
+                    state = list(zip(*state))
+                    prev_state = [torch.cat(t, dim=1) for t in state]
         else:
             raise TypeError("not support prev_state type: {}".format(type(prev_state)))
         return prev_state
@@ -185,10 +197,12 @@ class LSTM(nn.Module, LSTMForwardWrapper):
         next_state = []
         for l in range(self.num_layers):
             h, c = H[l], C[l]
+            # the input-side projection has no recurrent dependency, so it is computed
+            # for all timesteps in one batched matmul instead of seq_len small ones
+            gate_x = self.norm[l * 2](torch.matmul(x, self.wx[l]))
             new_x = []
             for s in range(seq_len):
-                gate = self.norm[l * 2](torch.matmul(x[s], self.wx[l])
-                                        ) + self.norm[l * 2 + 1](torch.matmul(h, self.wh[l]))
+                gate = gate_x[s] + self.norm[l * 2 + 1](torch.matmul(h, self.wh[l]))
                 if self.bias is not None:
                     gate += self.bias[l]
                 gate = list(torch.chunk(gate, 4, dim=1))